@@ -1,6 +1,16 @@
 """
 The NowEats application scrapes Twitter for what people are eating now.
 """
+import aliases
 import analysis
 import collection
 import extraction
+import geo
+import labels
+import provenance
+import replay
+import results
+import sampling
+import shared
+import tagged
+import trending
@@ -0,0 +1,130 @@
+"""
+Persistent table of canonical names for merged food counts.
+"""
+from collections import defaultdict
+from noweats.analysis import similarity_score
+
+import json
+
+
+class AliasTable(object):
+    """
+    Map variant food names to canonical names.
+
+    The table remembers merge decisions made by merge_most_common_counts() so
+    that later runs resolve known names in O(1). Manual overrides take
+    precedence over learned aliases and survive compaction.
+    """
+
+    def __init__(self, aliases=None, overrides=None, weights=None):
+        """
+        Create a table.
+
+        :param dict aliases: Learned map of variant to canonical name.
+        :param dict overrides: Manual map of variant to canonical name.
+        :param dict weights: Cumulative counts seen for each canonical name.
+        """
+        self._aliases = dict() if aliases is None else dict(aliases)
+        self._overrides = dict() if overrides is None else dict(overrides)
+        self._weights = defaultdict(int)
+        if weights is not None:
+            self._weights.update(weights)
+
+    def resolve(self, variant):
+        """
+        Get canonical name for variant or None when unknown.
+
+        An override target is itself resolved through the learned aliases so
+        that it follows later merges and compaction of its name.
+        """
+        canonical = self._overrides.get(variant)
+        if canonical is None:
+            return self._aliases.get(variant)
+        return self._aliases.get(canonical, canonical)
+
+    def add(self, variant, canonical, count=0):
+        """ Record that variant merges into canonical. """
+        self._aliases[variant] = canonical
+        self._aliases.setdefault(canonical, canonical)
+        self._weights[canonical] += count
+
+    def set_override(self, variant, canonical):
+        """ Manually map variant to canonical. """
+        self._overrides[variant] = canonical
+
+    def remove_override(self, variant):
+        """ Remove a manual override. """
+        try:
+            del self._overrides[variant]
+        except KeyError:
+            raise ValueError("No override for {}".format(variant))
+
+    @property
+    def overrides(self):
+        """ Get manual overrides. """
+        return dict(self._overrides)
+
+    def canonicals(self):
+        """ Get learned canonical names ordered by decreasing weight. """
+        return sorted(set(self._aliases.itervalues()),
+                      key=lambda key: self._weights[key], reverse=True)
+
+    def __len__(self):
+        return len(self._aliases)
+
+    def __contains__(self, variant):
+        return self.resolve(variant) is not None
+
+    def compact(self, simiarity_thresh=0.7, debug=False):
+        """
+        Re-cluster canonical names offline.
+
+        Canonical names are merged greedily in order of decreasing weight the
+        same way as merge_most_common_counts() merges keys, and every variant
+        is remapped to the heaviest name of its cluster.
+
+        N.B. This compares all pairs of canonical names and runs slowly.
+
+        :return int: number of canonical names merged away
+        """
+
+        canonicals = self.canonicals()
+        remap = dict()
+
+        for i, ikey in enumerate(canonicals):
+
+            if ikey in remap:
+                continue
+            remap[ikey] = ikey
+
+            keys_to_merge = [
+                jkey for jkey in canonicals[i + 1:]
+                if jkey not in remap
+                and similarity_score(ikey, jkey) > simiarity_thresh]
+
+            for jkey in keys_to_merge:
+                remap[jkey] = ikey
+                self._weights[ikey] += self._weights.pop(jkey, 0)
+
+            if debug is True and len(keys_to_merge) > 0:
+                print 'Compacting {} <= {}'.format(ikey, tuple(keys_to_merge))
+
+        self._aliases = {variant: remap[canonical]
+                         for variant, canonical in self._aliases.iteritems()}
+
+        return sum(1 for key, canonical in remap.iteritems()
+                   if key != canonical)
+
+    def save(self, fileobj):
+        """ Write the table as JSON. """
+        json.dump({
+            'aliases': self._aliases,
+            'overrides': self._overrides,
+            'weights': self._weights,
+        }, fileobj)
+
+    @classmethod
+    def load(cls, fileobj):
+        """ Read a table written by save(). """
+        state = json.load(fileobj)
+        return cls(state['aliases'], state['overrides'], state['weights'])
@@ -7,12 +7,26 @@ import itertools as it
 import math
 
 
+def similarity_score(key1, key2):
+    """ Score similarity of two keys by normalized edit distance. """
+    return 1. - (edit_distance(key1, key2) / float(max(len(key1), len(key2))))
+
+
 def merge_most_common_counts(counts, num_to_get=None,
                              simiarity_thresh=0.7,
-                             len_range=(3, 30), debug=False):
+                             len_range=(3, 30), debug=False, aliases=None,
+                             merged_keys=None):
     """
     Consolidate counts for sufficiently similar things.
 
+    When an alias table is given, keys it already knows are resolved to their
+    canonical names without any similarity search and keys are compared only
+    when at least one of them is new. Merge decisions are recorded back into
+    the table.
+
+    When a merged_keys dict is given, it is filled with the output key of each
+    input key that was kept.
+
     N.B. This runs slowly on entire datasets.
     """
 
@@ -22,9 +36,23 @@ def merge_most_common_counts(counts, num_to_get=None,
     if not isinstance(num_to_get, int) and num_to_get < 0:
         raise ValueError("Parameter num_to_get must be a positive number")
 
-    similarity_score = \
-        lambda k1, k2: 1. - (
-            edit_distance(k1, k2) / float(max(len(k1), len(k2))))
+    # Resolve known keys to canonical names.
+    known = set()
+    resolved_keys = dict()
+    if aliases is not None:
+        resolved = defaultdict(int)
+        for key, count in counts.iteritems():
+            canonical = aliases.resolve(key.lower())
+            if canonical is not None:
+                known.add(canonical)
+                resolved[canonical] += count
+                resolved_keys[key] = canonical
+            else:
+                resolved[key.lower()] += count
+                resolved_keys[key] = key.lower()
+        counts = resolved
+    elif merged_keys is not None:
+        resolved_keys = {key: key.lower() for key in counts}
 
     # Filter keys by minimum length. For each key, compute similarity ratio to
     # all other keys and merge sets based on threshold. Use key from the
@@ -38,6 +66,7 @@ def merge_most_common_counts(counts, num_to_get=None,
 
     merged = [None] * len(filtered_keys)
     merged_counts = defaultdict(int)
+    merged_to = dict()
 
     for i, ikey in enumerate(filtered_keys):
 
@@ -51,19 +80,30 @@ def merge_most_common_counts(counts, num_to_get=None,
         if len(merged_counts) == num_to_get:
             break
 
-        # Find similar jkeylower.
+        # Find similar jkeylower. Known keys were merged by earlier runs.
 
+        ikey_known = ikey in known
         keys_to_merge = [
             (j, jkey)
             for j, jkey in enumerate(filtered_keys[i + 1:], start=i + 1)
             if merged[j] is None
+            and not (ikey_known and jkey in known)
             and similarity_score(ikey, jkey) > simiarity_thresh]
 
+        # A new key joins at most one known key so that known keys are never
+        # merged with each other here.
+        if not ikey_known:
+            known_to_merge = [jkey for _, jkey in keys_to_merge
+                              if jkey in known][:1]
+            keys_to_merge = [(j, jkey) for j, jkey in keys_to_merge
+                             if jkey not in known or jkey in known_to_merge]
+
         key, count = ikey, counts[ikey]
         max_count = count
 
         # Remove these keys as we merge them, keeping the key name as the
-        # largest count.
+        # largest count. A known canonical name always wins so that names
+        # stay stable across runs.
 
         for j, jkey in keys_to_merge:
 
@@ -71,7 +111,7 @@ def merge_most_common_counts(counts, num_to_get=None,
 
             key_count = counts[jkey]
             count += key_count
-            if key_count > max_count:
+            if jkey in known or (key_count > max_count and key not in known):
                 max_count = key_count
                 key = jkey
 
@@ -80,8 +120,22 @@ def merge_most_common_counts(counts, num_to_get=None,
                 key, tuple(it.chain([ikey],
                                     it.imap(lambda (_, k): k,
                                             keys_to_merge))))
+
+        if aliases is not None:
+            for _, variant in it.chain([(i, ikey)], keys_to_merge):
+                aliases.add(variant, key, counts[variant])
+
+        if merged_keys is not None:
+            for _, variant in it.chain([(i, ikey)], keys_to_merge):
+                merged_to[variant] = key
+
         merged_counts[key] = count
 
+    if merged_keys is not None:
+        merged_keys.update((key, merged_to[resolved_key])
+                           for key, resolved_key in resolved_keys.iteritems()
+                           if resolved_key in merged_to)
+
     return merged_counts
 
 
@@ -115,16 +115,51 @@ class TimedRotatingStreamListener(StreamListener):
         """ Log stream data. """
         # Skip keep-alive newlines.
         data_stripped = data.strip()
-        if len(data) > 0:
+        if len(data_stripped) > 0:
             record = LogRecord(None, None, None, None, data_stripped, (), None)
             self._logger.emit(record)
 
+    def should_rollover(self):
+        """ Check whether the next write rolls over the output file. """
+        return self._logger.shouldRollover(None)
+
+    def flush(self):
+        """ Flush logged data. """
+        self._logger.flush()
+
+    def close(self):
+        """ Close the output file. """
+        self._logger.close()
+
     def on_error(self, status):
         """ Print status to stderr and raise exception. """
         sys.stderr.write('{}\n'.format(status))
         raise TweepError(status)
 
 
+class LocalStream(Stream):
+    """
+    A Stream that connects to a fixed host such as a local replay server.
+
+    The host is given to Stream as its host option and also ignores the
+    value that older versions of Stream assign when filtering. Streams
+    connect over https, so the server must serve TLS. Pass its certificate
+    as the verify option for it to be trusted.
+    """
+
+    def __init__(self, auth, listener, host, **options):
+        """
+        Create a stream for a host.
+
+        :param str host: Host and port such as 'localhost:8080'.
+        """
+        self._local_host = host
+        options['host'] = host
+        super(LocalStream, self).__init__(auth, listener, **options)
+
+    host = property(lambda self: self._local_host, lambda self, _: None)
+
+
 class StreamFilterRunner(object):
     """ Run a stream filter. """
 
@@ -133,17 +168,31 @@ class StreamFilterRunner(object):
 
         def __init__(self, runner):
 
-            self._listener = TimedRotatingStreamListener(runner.log_dir,
-                                                         runner.prefix,
-                                                         runner.when_interval)
-            self._stream = Stream(runner.auth, self._listener)
+            self._listener = runner.listener_class(runner.log_dir,
+                                                   runner.prefix,
+                                                   runner.when_interval)
+            if runner.stream_host is None:
+                self._stream = Stream(runner.auth, self._listener)
+            else:
+                self._stream = LocalStream(runner.auth, self._listener,
+                                           runner.stream_host,
+                                           **runner.stream_options)
             self._track = runner.track
             self._locations = runner.locations
 
+        @property
+        def listener(self):
+            """ Get the stream listener. """
+            return self._listener
+
         def run(self):
             """ Run the collector. """
             self._stream.filter(track=self._track, locations=self._locations)
 
+        def disconnect(self):
+            """ Stop the collector. """
+            self._stream.disconnect()
+
         def close(self):
             """ Close the collector. """
             self._stream.disconnect()
@@ -151,7 +200,9 @@ class StreamFilterRunner(object):
             self._listener.close()
 
     def __init__(self, api_keys, track, locations,
-                 log_dir, prefix, when_interval=None):
+                 log_dir, prefix, when_interval=None,
+                 stream_host=None, listener_class=None,
+                 stream_options=None):
         """
         Run a stream filter.
 
@@ -161,6 +212,12 @@ class StreamFilterRunner(object):
         :param str log_dir: Directory used to write tweets.
         :param str prefix: File output prefix.
         :param str when: Output file rollover interval.
+        :param str stream_host: Host and port of a local stream server to use
+        instead of Twitter.
+        :param type listener_class: Listener type created like a
+        TimedRotatingStreamListener.
+        :param dict stream_options: Options for the stream to the local
+        server such as verify.
         """
         self._api_keys = api_keys
         self._track = track
@@ -168,6 +225,11 @@ class StreamFilterRunner(object):
         self._log_dir = log_dir
         self._prefix = prefix
         self._when_interval = when_interval
+        self._stream_host = stream_host
+        self._stream_options = dict() if stream_options is None \
+            else dict(stream_options)
+        self._listener_class = TimedRotatingStreamListener \
+            if listener_class is None else listener_class
         self._stream_filter = None
 
     def __enter__(self):
@@ -177,6 +239,18 @@ class StreamFilterRunner(object):
         else:
             raise ValueError("Cannot start again")
 
+    def disconnect(self):
+        """ Stop a running stream filter from another thread. """
+        if self._stream_filter is not None:
+            self._stream_filter.disconnect()
+
+    @property
+    def listener(self):
+        """ Get the listener of the running stream filter or None. """
+        if self._stream_filter is None:
+            return None
+        return self._stream_filter.listener
+
     def __exit__(self, valtype, value, traceback):
         self._stream_filter.close()
         return False  # do not suppress exceptions
@@ -210,3 +284,18 @@ class StreamFilterRunner(object):
     def when_interval(self):
         """ Get output interval. """
         return self._when_interval
+
+    @property
+    def stream_host(self):
+        """ Get local stream host or None for Twitter. """
+        return self._stream_host
+
+    @property
+    def stream_options(self):
+        """ Get options for the stream to the local server. """
+        return self._stream_options
+
+    @property
+    def listener_class(self):
+        """ Get listener type. """
+        return self._listener_class
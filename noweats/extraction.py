@@ -7,9 +7,11 @@ from nltk.chunk import RegexpParser
 from nltk.corpus import stopwords
 from nltk.tag.perceptron import PerceptronTagger
 from nltk.tag import _pos_tag
-from noweats.util import counter
+from noweats.tagged import TaggedBatch
+from noweats.util import counter, StreamingQuantile
 from unidecode import unidecode
 from HTMLParser import HTMLParser
+from array import array
 
 import re
 import json
@@ -50,13 +52,30 @@ _RE_FOOD_POS = re.compile('^N.*|^JJ')
 
 _TEXT_FIELD = '"text":'
 _LANG_EN_PREFIX = '"lang":"en'
-_RE_CHECK_TWEET = re.compile('|'.join([
+_CHECK_TWEET = [
     '"retweeted_status":',  # is a retweet
     '{}"RT'.format(_TEXT_FIELD),  # is a retweet by text
     '"lang":"[^"]+"',  # get lang
     _TEXT_FIELD,  # get text field start
+]
+_RE_CHECK_TWEET = re.compile('|'.join(_CHECK_TWEET))
+
+_POINT_FIELD = '"coordinates":{"type":"Point","coordinates":['
+_PLACE_BOX_FIELD = '"bounding_box":{"type":"Polygon","coordinates":[[['
+_ID_FIELD = '"id":'
+_META_FIELDS = (_POINT_FIELD, _PLACE_BOX_FIELD, _ID_FIELD)
+_RE_CHECK_TWEET_META = re.compile('|'.join(_CHECK_TWEET + [
+    re.escape(_POINT_FIELD),  # get exact location start
+    re.escape(_PLACE_BOX_FIELD),  # get place bounds start
+    _ID_FIELD,  # get id start, the first being the tweet id
 ]))
 
+_NUMBER = '(-?[0-9.]+)'
+_RE_POINT = re.compile('{0},{0}\\]'.format(_NUMBER))
+_RE_ID = re.compile('\\d+')
+_RE_PLACE_BOX = re.compile(
+    '{0},{0}\\],\\[-?[0-9.]+,-?[0-9.]+\\],\\[{0},{0}\\]'.format(_NUMBER))
+
 _FILTER_POS = lambda (_, pos): _RE_FOOD_POS.match(pos) is not None
 
 _STOPWORDS_EN = set(stopwords.words('english'))
@@ -74,22 +93,90 @@ def _build_noun_chunker():
 _CHUNKER = _build_noun_chunker()
 
 
-def extract_tweet_en_not_rt(raw_json):
-    """ Extract tweets that are English and not a retweet. """
+def _scan_tweet(raw_json, check_re):
+    """
+    Scan a tweet once for its text fields and any extra fields in check_re.
+
+    :return tuple: list of text field starts and dict of first end of each
+    extra field, or None when the tweet is not English or is a retweet
+    """
     matched = False
     text_starts = []
-    for match in _RE_CHECK_TWEET.finditer(raw_json):
-        if match.group() == _TEXT_FIELD:
+    field_ends = dict()
+    for match in check_re.finditer(raw_json):
+        group = match.group()
+        if group == _TEXT_FIELD:
             text_starts.append(match.end())
-        elif match.group().startswith(_LANG_EN_PREFIX):
+        elif group.startswith(_LANG_EN_PREFIX):
             matched = True
+        elif group in _META_FIELDS:
+            field_ends.setdefault(group, match.end())
         else:
             matched = False
             break
-    # Return longest text field (since hashtags also are text).
     if matched and len(text_starts) > 0:
-        return max((extract_tweet_text(raw_json, text_start)
-                    for text_start in text_starts), key=len)
+        return text_starts, field_ends
+    else:
+        return None
+
+
+def _longest_text(raw_json, text_starts):
+    """ Get the longest text field (since hashtags also are text). """
+    return max((extract_tweet_text(raw_json, text_start)
+                for text_start in text_starts), key=len)
+
+
+def extract_tweet_en_not_rt(raw_json):
+    """ Extract tweets that are English and not a retweet. """
+    scanned = _scan_tweet(raw_json, _RE_CHECK_TWEET)
+    if scanned is not None:
+        return _longest_text(raw_json, scanned[0])
+    else:
+        return None
+
+
+def _tweet_location(raw_json, field_ends):
+    """
+    Get (lon, lat) of a tweet from its exact coordinates or else the center
+    of its place bounds, or None when it has neither.
+    """
+    if _POINT_FIELD in field_ends:
+        match = _RE_POINT.match(raw_json, field_ends[_POINT_FIELD])
+        if match is not None:
+            return float(match.group(1)), float(match.group(2))
+    if _PLACE_BOX_FIELD in field_ends:
+        match = _RE_PLACE_BOX.match(raw_json, field_ends[_PLACE_BOX_FIELD])
+        if match is not None:
+            west, south, east, north = (float(num) for num in match.groups())
+            return (west + east) / 2., (south + north) / 2.
+    return None
+
+
+def _tweet_id(raw_json, field_ends):
+    """ Get the id of a tweet or None when it has none. """
+    if _ID_FIELD in field_ends:
+        match = _RE_ID.match(raw_json, field_ends[_ID_FIELD])
+        if match is not None:
+            return int(match.group())
+    return None
+
+
+def extract_tweet_en_not_rt_meta(raw_json):
+    """
+    Extract tweets that are English and not a retweet with their ids and
+    locations.
+
+    Ids and locations are found in the same scan as the text.
+
+    :return tuple: (id or None, (lon, lat) or None, text) or None when not
+    extracted
+    """
+    scanned = _scan_tweet(raw_json, _RE_CHECK_TWEET_META)
+    if scanned is not None:
+        text_starts, field_ends = scanned
+        return (_tweet_id(raw_json, field_ends),
+                _tweet_location(raw_json, field_ends),
+                _longest_text(raw_json, text_starts))
     else:
         return None
 
@@ -126,13 +213,32 @@ def read_tweets_en_not_rt(data_path):
         #    yield raw_json
 
 
-def sentence_split_clean_data(tweets, eat_lexicon):
+def read_tweets_en_not_rt_meta(data_path):
+    """
+    Read (id, offset, location, tweet) tuples from compressed file ignoring
+    retweets and non-English tweets.
+
+    The offset is the position of the tweet in the uncompressed file.
+    """
+    offset = 0
+    with bz2.BZ2File(data_path, 'rb') as data_file:
+        for raw_json in data_file:
+            extracted = extract_tweet_en_not_rt_meta(raw_json)
+            if extracted is not None:
+                tweet_id, location, text = extracted
+                yield tweet_id, offset, location, text
+            offset += len(raw_json)
+
+
+def sentence_split_clean_data(tweets, eat_lexicon, keyed=False):
     """
     Remove hyperlinks and unprintable tokens from tweets and split them into
     sentences.
 
     :param iterable tweets: iterable of tweet text strings
     :param list eat_lexicon: list of eat words
+    :param bool keyed: tweets are (key, text) pairs and the output is
+    (key, sentences) pairs
     :return list: list of tuples of sentences split from tweets where each
     sentence contains at least one word from the eat lexicon
     """
@@ -143,27 +249,40 @@ def sentence_split_clean_data(tweets, eat_lexicon):
         _RE_SENTENCE.split(_RE_PREPROC.sub('', tweet))
     clean_sentence = lambda sentence: \
         _RE_FIX_WHITESPACE.sub(' ', _RE_REMOVE_CHARS.sub(' ', sentence)).strip()
+    split_clean = lambda tweet: tuple(
+        clean_sentence(sentence)
+        for sentence in raw_to_sentences(tweet)
+        if eat_lexicon_re.search(sentence) is not None
+    )
+    if keyed:
+        return (
+            (key, sentences) for key, sentences in
+            ((key, split_clean(tweet)) for key, tweet in tweets)
+            if len(sentences) > 0
+        )
     return (
-        sentences for sentences in
-        (tuple(clean_sentence(sentence)
-               for sentence in raw_sentences
-               if eat_lexicon_re.search(sentence) is not None
-               )
-         for raw_sentences in its.imap(raw_to_sentences, tweets)
-         )
+        sentences for sentences in its.imap(split_clean, tweets)
         if len(sentences) > 0
     )
 
 
-def remove_dups(tweets, keep_thresh=1):
-    """ Filter duplicate tweets since they are likely to be spam. """
+def remove_dups(tweets, keep_thresh=1, keyed=False):
+    """
+    Filter duplicate tweets since they are likely to be spam.
+
+    When keyed, tweets are (key, sentences) pairs.
+    """
     hash_tw = lambda tw: tuple(set(w for w in (w.lower()
                                                for s in tw
                                                for w in s.split())
                                    if w not in _STOPWORDS_EN))
+    if keyed:
+        hash_item = lambda (_, tw): hash_tw(tw)
+    else:
+        hash_item = hash_tw
     hash_to_tweets = defaultdict(list)
     for tw in tweets:
-        hash_to_tweets[hash_tw(tw)].append(tw)
+        hash_to_tweets[hash_item(tw)].append(tw)
     return (tw
             for hash_tweets in hash_to_tweets.itervalues()
             for tw in hash_tweets
@@ -198,11 +317,94 @@ def tokenize_keep_en_tweets(tweets, en_model, keep_pct=0.95):
     return by_score[:to_keep]
 
 
+def tokenize_keep_en_tweets_stream(tweets, en_model, keep_pct=0.95,
+                                   warmup=1000):
+    """
+    Tokenize tweets split already into sentences and yield those likely to be
+    English as they pass.
+
+    Like tokenize_keep_en_tweets(), except that the score cutoff for keeping
+    keep_pct of the tweets is estimated online. The first warmup tweets are
+    buffered to seed the estimate. Each tweet is scored once and tweets are
+    yielded in input order.
+    """
+
+    if keep_pct <= 0:
+        return
+
+    # The estimated minimum can sit above the true one, so keep all exactly.
+    if keep_pct >= 1:
+        for tweet in tweets:
+            yield tokenize_tweet(tweet)
+        return
+
+    cutoff = StreamingQuantile(1. - keep_pct)
+    warming = []
+
+    for tweet in tweets:
+
+        tokenized = tokenize_tweet(tweet)
+        score = score_tweet_en(tokenized, en_model)
+        cutoff.add(score)
+
+        if warming is None:
+            if score >= cutoff.value:
+                yield tokenized
+        else:
+            warming.append((score, tokenized))
+            if len(warming) >= warmup:
+                for warm_score, warm_tweet in warming:
+                    if warm_score >= cutoff.value:
+                        yield warm_tweet
+                warming = None
+
+    for warm_score, warm_tweet in warming or []:
+        if warm_score >= cutoff.value:
+            yield warm_tweet
+
+
+def tokenize_keep_en_tweets_two_pass(read_tweets, en_model, keep_pct=0.95):
+    """
+    Tokenize tweets split already into sentences and yield those likely to be
+    English using two passes over the input.
+
+    The first pass scores every tweet once, keeping only the scores. The second
+    pass yields the same tweets that tokenize_keep_en_tweets() keeps, but in
+    input order.
+
+    :param callable read_tweets: Returns a new iterable of the same tweets on
+    each call, such as by reading them from disk.
+    """
+
+    scores = array('d', (score_tweet_en(tokenize_tweet(tweet), en_model)
+                         for tweet in read_tweets()))
+
+    to_keep = int(keep_pct * len(scores))
+    if to_keep == 0:
+        return
+
+    # Keep ties at the cutoff in input order up to the number to keep.
+    cutoff = sorted(scores, reverse=True)[to_keep - 1]
+    ties_to_keep = to_keep - sum(1 for score in scores if score > cutoff)
+
+    for score, tweet in its.izip(scores, read_tweets()):
+        if score == cutoff and ties_to_keep > 0:
+            ties_to_keep -= 1
+            yield tokenize_tweet(tweet)
+        elif score > cutoff:
+            yield tokenize_tweet(tweet)
+
+
 def pos_tag_tweet(tweet):
     """ POS tag tweets split already into sentences. """
     return tuple(_pos_tag(sentence, None, _TAGGER) for sentence in tweet)
 
 
+def pos_tag_batch(tweets):
+    """ POS tag tweets split already into sentences into a TaggedBatch. """
+    return TaggedBatch.from_tweets(pos_tag_tweet(tweet) for tweet in tweets)
+
+
 def chunk_tweet(pos_tagged_tweet):
     """
     Use a chunk parser to parse the output of pos_tag_clean_text_data().
@@ -330,8 +532,22 @@ def filters_from_dict(fdict):
             lambda w: not any(fw == w for fw in fdict['match'])]
 
 
+def extract_foods(chunked_tweet, eat_lexicon, filters, debug=False):
+    """ Get foods from one chunked tweet using parse_food_phrase(). """
+    return [food for food in (parse_food_phrase(tree, eat_lexicon, filters,
+                                                debug)
+                              for tree in chunked_tweet)
+            if food is not None]
+
+
 def count_foods(chunked_tweets, eat_lexicon, filters, debug=False):
-    """ Count foods from pos tagged sentences using parse_food_phrase(). """
+    """
+    Count foods from pos tagged sentences using parse_food_phrase().
+
+    A TaggedBatch is chunked here as it is read.
+    """
+    if isinstance(chunked_tweets, TaggedBatch):
+        chunked_tweets = its.imap(chunk_tweet, chunked_tweets)
     counts = counter(parse_food_phrase(tree, eat_lexicon, filters, debug)
                      for tweet in chunked_tweets
                      for tree in tweet)
@@ -0,0 +1,172 @@
+"""
+Spatial index of food counts over geohash cells.
+"""
+from collections import defaultdict
+
+import json
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+_BASE32_INDEX = {char: idx for idx, char in enumerate(_BASE32)}
+
+
+def geohash_encode(lon, lat, precision=6):
+    """ Get the geohash cell of precision chars containing a point. """
+    lon_range, lat_range = [-180., 180.], [-90., 90.]
+    chars = []
+    bits, num_bits, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2.
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        num_bits += 1
+        if num_bits == 5:
+            chars.append(_BASE32[bits])
+            bits, num_bits = 0, 0
+    return ''.join(chars)
+
+
+def geohash_bbox(cell):
+    """ Get (west, south, east, north) bounds of a geohash cell. """
+    lon_range, lat_range = [-180., 180.], [-90., 90.]
+    even = True
+    for char in cell:
+        bits = _BASE32_INDEX[char]
+        for shift in xrange(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2.
+            if (bits >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lon_range[0], lat_range[0], lon_range[1], lat_range[1]
+
+
+class SpatialCounts(object):
+    """
+    Food counts binned by geohash cell.
+
+    Counts added at the finest precision are also aggregated into every
+    coarser cell containing them, so a rectangle query sums a few large cells
+    inside the rectangle and only descends into cells on its border.
+    Instances merge by adding counts, so per-hour indexes combine into
+    indexes over any time range.
+    """
+
+    def __init__(self, precision=6):
+        """
+        Create an empty index.
+
+        :param int precision: Geohash length of the finest cells.
+        """
+        self._precision = precision
+        self._cells = defaultdict(lambda: defaultdict(int))
+
+    @property
+    def precision(self):
+        """ Get geohash length of the finest cells. """
+        return self._precision
+
+    def add(self, lon, lat, foods):
+        """ Count foods seen at a point. """
+        cell = geohash_encode(lon, lat, self._precision)
+        for food in foods:
+            self.add_counts(cell, {food: 1})
+
+    def add_counts(self, cell, counts):
+        """ Add food counts to a finest precision cell. """
+        if len(cell) != self._precision:
+            raise ValueError("Cell {} is not of precision {}"
+                             .format(cell, self._precision))
+        for level in xrange(1, self._precision + 1):
+            cell_counts = self._cells[cell[:level]]
+            for food, count in counts.iteritems():
+                cell_counts[food] += count
+
+    def merge(self, other):
+        """ Add counts from another index of the same precision. """
+        if other.precision != self._precision:
+            raise ValueError("Cannot merge precision {} into {}"
+                             .format(other.precision, self._precision))
+        for cell, counts in other.finest_cells():
+            self.add_counts(cell, counts)
+
+    def finest_cells(self):
+        """ Iterate over (cell, counts) of the finest cells. """
+        return ((cell, counts) for cell, counts in self._cells.iteritems()
+                if len(cell) == self._precision)
+
+    def cell_counts(self, cell):
+        """ Get counts within a geohash cell of any precision. """
+        if len(cell) > self._precision:
+            raise ValueError("Cell {} is finer than precision {}"
+                             .format(cell, self._precision))
+        return dict(self._cells.get(cell, {}))
+
+    def _cover(self, bbox, prefix=''):
+        """
+        Find cells covering bbox.
+
+        Cells inside bbox are used whole. Finest cells on the border are used
+        when their centers are inside bbox.
+        """
+        west, south, east, north = bbox
+        for char in _BASE32:
+            cell = prefix + char
+            if cell not in self._cells:
+                continue
+            cwest, csouth, ceast, cnorth = geohash_bbox(cell)
+            if ceast <= west or cwest >= east \
+                    or cnorth <= south or csouth >= north:
+                continue
+            if cwest >= west and ceast <= east \
+                    and csouth >= south and cnorth <= north:
+                yield cell
+            elif len(cell) == self._precision:
+                lon, lat = (cwest + ceast) / 2., (csouth + cnorth) / 2.
+                if west <= lon < east and south <= lat < north:
+                    yield cell
+            else:
+                for subcell in self._cover(bbox, cell):
+                    yield subcell
+
+    def region_counts(self, bbox):
+        """
+        Get counts within a rectangle.
+
+        :param tuple bbox: (west, south, east, north) bounds in degrees.
+        """
+        counts = defaultdict(int)
+        for cell in self._cover(bbox):
+            for food, count in self._cells[cell].iteritems():
+                counts[food] += count
+        return counts
+
+    def top(self, bbox, num=10):
+        """ Get the most counted (food, count) pairs within a rectangle. """
+        by_count = sorted(self.region_counts(bbox).iteritems(),
+                          key=lambda (food, count): (-count, food))
+        return by_count[:num]
+
+    def save(self, fileobj):
+        """ Write the finest cells as JSON. """
+        json.dump({
+            'precision': self._precision,
+            'cells': dict(self.finest_cells()),
+        }, fileobj)
+
+    @classmethod
+    def load(cls, fileobj):
+        """ Read an index written by save(). """
+        state = json.load(fileobj)
+        spatial_counts = cls(state['precision'])
+        for cell, counts in state['cells'].iteritems():
+            spatial_counts.add_counts(cell, counts)
+        return spatial_counts
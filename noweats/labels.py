@@ -0,0 +1,108 @@
+"""
+Store food/not-food labels and score precision of food counts with them.
+"""
+from collections import defaultdict
+
+import json
+import os
+
+
+class LabelStore(object):
+    """
+    Append-only log of food labels.
+
+    Each line of the log is a JSON list [food, is_food]. Replaying the log in
+    order gives the current labels, so relabeling a food only appends a line.
+    """
+
+    def __init__(self, path):
+        """
+        Open the log at path, creating it when missing.
+
+        :param str path: Path to the label log.
+        """
+        self._path = path
+        self._labels = dict()
+        if os.path.exists(path):
+            with open(path, 'rU') as log_file:
+                for line in log_file:
+                    line = line.strip()
+                    if len(line) > 0:
+                        food, is_food = json.loads(line)
+                        self._labels[food] = is_food
+        self._log_file = open(path, 'a')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, valtype, value, traceback):
+        self.close()
+        return False  # do not suppress exceptions
+
+    def close(self):
+        """ Close the log. """
+        self._log_file.close()
+
+    def label(self, food):
+        """ Get True for food, False for not food, or None when unlabeled. """
+        return self._labels.get(food)
+
+    def mark(self, food, is_food):
+        """ Label a food, appending to the log when the label changes. """
+        is_food = bool(is_food)
+        if self._labels.get(food) is not is_food:
+            self._labels[food] = is_food
+            self._log_file.write('{}\n'.format(json.dumps([food, is_food])))
+            self._log_file.flush()
+
+    def import_cache(self, cache_path):
+        """
+        Import labels from a [foods, not_foods] JSON cache.
+
+        Labels in the store are kept over labels in the cache.
+        """
+        with open(cache_path, 'rU') as cache_file:
+            foods, not_foods = json.load(cache_file)
+        for is_food, items in [(True, foods), (False, not_foods)]:
+            for food in items:
+                if food not in self._labels:
+                    self.mark(food, is_food)
+
+    def compact(self):
+        """ Rewrite the log with one line per labeled food. """
+        self._log_file.close()
+        tmp_path = '{}.tmp'.format(self._path)
+        with open(tmp_path, 'w') as tmp_file:
+            for food, is_food in sorted(self._labels.iteritems()):
+                tmp_file.write('{}\n'.format(json.dumps([food, is_food])))
+        os.rename(tmp_path, self._path)
+        self._log_file = open(self._path, 'a')
+
+    @property
+    def labels(self):
+        """ Get dict of food to label. """
+        return dict(self._labels)
+
+    def __len__(self):
+        return len(self._labels)
+
+
+def precision_counts(food_counts, labels):
+    """
+    Split counts by label.
+
+    :param dict food_counts: Counts output for some file.
+    :param dict labels: Map of food to True when relevant, False when not.
+    :return tuple: (correct, labeled) total counts and dict of unlabeled counts
+    """
+    correct, labeled = 0, 0
+    unlabeled = defaultdict(int)
+    for food, count in food_counts.iteritems():
+        is_food = labels.get(food)
+        if is_food is None:
+            unlabeled[food] += count
+        else:
+            labeled += count
+            if is_food:
+                correct += count
+    return correct, labeled, unlabeled
@@ -0,0 +1,121 @@
+"""
+Index from counted foods back to the tweets they were extracted from.
+"""
+from collections import defaultdict
+from noweats.util import open_archive
+
+import json
+
+
+class SourceIndex(object):
+    """
+    Inverted index from foods to their source tweets in one data file.
+
+    Tweets are stored once as an id and the offset of their line in the
+    uncompressed data file, and foods map to lists of tweet numbers. Foods
+    are indexed as extracted, and the names they were merged into map to the
+    extracted foods they cover.
+    """
+
+    def __init__(self, source=None):
+        """
+        Create an empty index.
+
+        :param str source: Path to the data file indexed.
+        """
+        self.source = source
+        self._ids = []
+        self._offsets = []
+        self._tweet_nums = dict()
+        self._foods = defaultdict(list)
+        self._merged = defaultdict(list)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def add(self, food, tweet_id, offset):
+        """ Record that food was extracted from the tweet at offset. """
+        tweet_num = self._tweet_nums.get(offset)
+        if tweet_num is None:
+            tweet_num = len(self._offsets)
+            self._tweet_nums[offset] = tweet_num
+            self._ids.append(tweet_id)
+            self._offsets.append(offset)
+        tweet_nums = self._foods[food]
+        if len(tweet_nums) == 0 or tweet_nums[-1] != tweet_num:
+            tweet_nums.append(tweet_num)
+
+    def set_merged(self, merged_keys):
+        """
+        Record the merged names of foods.
+
+        :param dict merged_keys: Merged name of each extracted food as filled
+        by noweats.analysis.merge_most_common_counts().
+        """
+        self._merged.clear()
+        for food, merged_food in merged_keys.iteritems():
+            if food in self._foods:
+                self._merged[merged_food].append(food)
+
+    def foods(self):
+        """ Get extracted foods. """
+        return self._foods.keys()
+
+    def merged_foods(self, merged_food):
+        """ Get extracted foods merged into a name. """
+        return list(self._merged.get(merged_food, []))
+
+    def sources(self, food):
+        """
+        Get sources of an extracted or merged food.
+
+        A merged name covers the sources of all foods merged into it.
+
+        :return list: (tweet id, offset) pairs in file order
+        """
+        tweet_nums = set(self._foods.get(food, []))
+        for extracted in self._merged.get(food, []):
+            tweet_nums.update(self._foods[extracted])
+        return sorted(((self._ids[num], self._offsets[num])
+                       for num in tweet_nums),
+                      key=lambda (_, offset): offset)
+
+    def save(self, fileobj):
+        """ Write the index as JSON. """
+        json.dump({
+            'source': self.source,
+            'ids': self._ids,
+            'offsets': self._offsets,
+            'foods': self._foods,
+            'merged': self._merged,
+        }, fileobj)
+
+    @classmethod
+    def load(cls, fileobj):
+        """ Read an index written by save(). """
+        state = json.load(fileobj)
+        index = cls(state['source'])
+        index._ids = state['ids']
+        index._offsets = state['offsets']
+        index._tweet_nums = {offset: num
+                             for num, offset in enumerate(index._offsets)}
+        index._foods.update(state['foods'])
+        index._merged.update(state['merged'])
+        return index
+
+
+def read_lines_at(data_path, offsets):
+    """
+    Read the lines starting at uncompressed offsets of a data file.
+
+    Offsets are visited in order, so a compressed file is decompressed once
+    up to the last offset rather than rescanned for each line.
+
+    :return list: (offset, line) pairs in offset order
+    """
+    lines = []
+    with open_archive(data_path) as data_file:
+        for offset in sorted(set(offsets)):
+            data_file.seek(offset)
+            lines.append((offset, data_file.readline().rstrip('\r\n')))
+    return lines
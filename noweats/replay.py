@@ -0,0 +1,341 @@
+"""
+Replay archived tweets over the Twitter streaming protocol for load tests.
+"""
+from array import array
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from datetime import datetime
+from logging import getLogger
+from noweats.collection import TimedRotatingStreamListener
+from noweats.util import open_archive
+from threading import Condition, Event, Lock, Thread
+
+import calendar
+import itertools as its
+import re
+import socket
+import ssl
+import time
+
+_LOGGER = getLogger(__name__)
+
+_RE_TIMESTAMP_MS = re.compile('"timestamp_ms":\\s*"(\\d+)"')
+
+_RE_CREATED_AT = re.compile('"created_at":\\s*"([^"]+)"')
+
+_CREATED_AT_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+
+# Keep-alives written after the last tweet so that clients reading the stream in
+# chunks (tweepy reads 512 bytes at a time) get the last tweets.
+_END_PADDING = '\r\n' * 512
+
+
+def tweet_time(raw_json):
+    """ Get tweet creation time in seconds since the epoch or None. """
+    match = _RE_TIMESTAMP_MS.search(raw_json)
+    if match is not None:
+        return int(match.group(1)) / 1000.
+    match = _RE_CREATED_AT.search(raw_json)
+    if match is not None:
+        try:
+            return calendar.timegm(
+                datetime.strptime(match.group(1),
+                                  _CREATED_AT_FORMAT).timetuple())
+        except ValueError:
+            pass
+    return None
+
+
+def percentile(values, pct):
+    """ Get a percentile of values by nearest rank. """
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    rank = int(round(pct / 100. * (len(ordered) - 1)))
+    return ordered[rank]
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    """ Answer stream requests by replaying tweets. """
+
+    protocol_version = 'HTTP/1.0'
+
+    def _replay(self):
+        """ Stream tweets until they run out or the server stops. """
+        length = int(self.headers.getheader('content-length') or 0)
+        if length > 0:
+            self.rfile.read(length)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        try:
+            self.server.replay(self.wfile, 'delimited=length' in self.path)
+        except socket.error:
+            _LOGGER.info("Stream client disconnected")
+
+    do_GET = _replay
+
+    do_POST = _replay
+
+    def log_message(self, fmt, *args):
+        _LOGGER.debug(fmt, *args)
+
+
+class ReplayServer(ThreadingMixIn, HTTPServer):
+    """
+    Serve archived tweets like the Twitter streaming API.
+
+    Every connection replays the archives from the start. Tweets are paced
+    either at a multiple of the speed they were collected or at a fixed rate
+    and keep-alive newlines are sent while idle. Tweets that fall more than
+    max_lag seconds behind schedule are dropped, like Twitter does for slow
+    consumers. Streams connect over https, so the server serves TLS when
+    given a certificate.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, paths, speed=None, rate=None, keep_alive=30.,
+                 max_lag=None, loop=False, address=('localhost', 0),
+                 certfile=None, keyfile=None):
+        """
+        Create a server. Call start() to serve.
+
+        :param list paths: Archive files to replay in order.
+        :param float speed: Multiple of collection speed to replay.
+        :param float rate: Tweets per second to replay.
+        :param float keep_alive: Seconds between keep-alive newlines.
+        :param float max_lag: Seconds behind schedule to drop tweets.
+        :param bool loop: Replay archives again when they run out.
+        :param tuple address: Host and port to bind.
+        :param str certfile: PEM certificate to serve TLS with.
+        :param str keyfile: PEM private key of the certificate.
+        """
+        if speed is not None and rate is not None:
+            raise ValueError("Give one of speed or rate")
+        HTTPServer.__init__(self, address, _ReplayHandler)
+        if certfile is not None:
+            self.socket = ssl.wrap_socket(self.socket, keyfile=keyfile,
+                                          certfile=certfile, server_side=True)
+        self._host_name = address[0] or self.server_address[0]
+        self._paths = list(paths)
+        self._speed = speed
+        self._rate = rate
+        self._keep_alive = keep_alive
+        self._max_lag = max_lag
+        self._loop = loop
+        self._stopped = Event()
+        self._finished = Event()
+        self._thread = None
+        self._stats_lock = Lock()
+        self._sending = 0
+        self._sending_done = Condition(self._stats_lock)
+        self._sent = 0
+        self._dropped = 0
+        self._bytes_sent = 0
+        self._max_behind = 0.
+        self._exhausted = Event()
+
+    @property
+    def host(self):
+        """ Get host and port to connect to. """
+        _, port = self.server_address
+        return '{}:{}'.format(self._host_name, port)
+
+    @property
+    def exhausted(self):
+        """ Get whether a connection has replayed all archives. """
+        return self._exhausted.is_set()
+
+    def stats(self):
+        """ Get dict of tweets sent, dropped, bytes, and max lag. """
+        with self._stats_lock:
+            return {
+                'sent': self._sent,
+                'dropped': self._dropped,
+                'bytes_sent': self._bytes_sent,
+                'max_behind': self._max_behind,
+            }
+
+    def start(self):
+        """ Serve in a background thread. """
+        self._thread = Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def finish(self, timeout=None):
+        """
+        Stop sending tweets but keep streams open with keep-alives.
+
+        Waits up to timeout seconds for tweets being written to be sent, so
+        that sent in stats() is final for streams that keep up.
+
+        :return bool: Whether every stream stopped sending in time.
+        """
+        self._finished.set()
+        end = None if timeout is None else time.time() + timeout
+        with self._sending_done:
+            while self._sending > 0:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._sending_done.wait(remaining)
+        return True
+
+    def stop(self):
+        """ Stop serving and end open streams. """
+        self._stopped.set()
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def _tweets(self):
+        """ Iterate over raw tweets from the archives. """
+        passes = its.count() if self._loop else xrange(1)
+        for _ in passes:
+            for path in self._paths:
+                with open_archive(path) as data_file:
+                    for line in data_file:
+                        if len(line.strip()) > 0:
+                            yield line.rstrip('\r\n')
+
+    def _wait(self, wfile, deadline, last_write, until_finished=False):
+        """ Sleep until deadline sending keep-alives. Get last write time. """
+        while not self._stopped.is_set():
+            now = time.time()
+            if now >= deadline or (until_finished and self._finished.is_set()):
+                break
+            if now - last_write >= self._keep_alive:
+                wfile.write('\r\n')
+                wfile.flush()
+                last_write = now
+            time.sleep(min(deadline - now, 0.1,
+                           self._keep_alive - (now - last_write)))
+        return last_write
+
+    def replay(self, wfile, delimited):
+        """ Write tweets to a stream response. """
+
+        start = last_write = time.time()
+        with self._stats_lock:
+            self._sending += 1
+        try:
+            last_write = self._send(wfile, delimited, start, last_write)
+        finally:
+            with self._sending_done:
+                self._sending -= 1
+                self._sending_done.notify_all()
+
+        if not self._stopped.is_set():
+            wfile.write(_END_PADDING)
+            wfile.flush()
+            last_write = time.time()
+
+        # Idle like a quiet stream until the server stops.
+        while not self._stopped.is_set():
+            last_write = self._wait(wfile, time.time() + self._keep_alive,
+                                    last_write)
+
+    def _send(self, wfile, delimited, start, last_write):
+        """ Write scheduled tweets until finished. Get last write time. """
+
+        first_time, last_time = None, None
+
+        for idx, raw_json in enumerate(self._tweets()):
+
+            if self._stopped.is_set() or self._finished.is_set():
+                return last_write
+
+            # Schedule the tweet.
+            if self._rate is not None:
+                deadline = start + idx / float(self._rate)
+            elif self._speed is not None:
+                created = tweet_time(raw_json)
+                last_time = created if created is not None else last_time
+                if first_time is None:
+                    first_time = last_time
+                offset = 0 if last_time is None else last_time - first_time
+                deadline = start + offset / float(self._speed)
+            else:
+                deadline = start
+
+            last_write = self._wait(wfile, deadline, last_write,
+                                    until_finished=True)
+            if self._finished.is_set():
+                return last_write
+            behind = time.time() - deadline
+
+            if self._max_lag is not None and behind > self._max_lag:
+                with self._stats_lock:
+                    self._dropped += 1
+                continue
+
+            payload = '{}\r\n'.format(raw_json)
+            if delimited:
+                wfile.write('{}\r\n'.format(len(payload)))
+            wfile.write(payload)
+            wfile.flush()
+            last_write = time.time()
+
+            with self._stats_lock:
+                self._sent += 1
+                self._bytes_sent += len(payload)
+                self._max_behind = max(self._max_behind, behind)
+
+        self._exhausted.set()
+        return last_write
+
+
+class InstrumentedStreamListener(TimedRotatingStreamListener):
+    """
+    A TimedRotatingStreamListener that measures its writes.
+
+    Latencies of writes that roll over the output file are kept apart so that
+    rollover stalls stand out.
+    """
+
+    def __init__(self, log_dir, prefix, when_interval=None):
+        super(InstrumentedStreamListener, self).__init__(log_dir, prefix,
+                                                         when_interval)
+        self._lock = Lock()
+        self._received = 0
+        self._last_received = None
+        self._latencies = array('d')
+        self._rollover_latencies = array('d')
+
+    def on_data(self, data):
+        """ Log stream data and time the write. """
+        if len(data.strip()) == 0:
+            return
+        rollover = self.should_rollover()
+        start = time.time()
+        super(InstrumentedStreamListener, self).on_data(data)
+        end = time.time()
+        elapsed = end - start
+        with self._lock:
+            self._received += 1
+            self._last_received = end
+            if rollover:
+                self._rollover_latencies.append(elapsed)
+            else:
+                self._latencies.append(elapsed)
+
+    def stats(self):
+        """ Get dict of tweets received, last receive time, and latencies. """
+        with self._lock:
+            latencies = self._latencies.tolist()
+            rollovers = self._rollover_latencies.tolist()
+            received = self._received
+            last_received = self._last_received
+        return {
+            'received': received,
+            'last_received': last_received,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p99': percentile(latencies, 99),
+            'latency_max': max(latencies) if len(latencies) > 0 else None,
+            'rollovers': len(rollovers),
+            'rollover_max': max(rollovers) if len(rollovers) > 0 else None,
+        }
@@ -0,0 +1,170 @@
+"""
+Indexed store of processed counts for queries over time ranges.
+"""
+from noweats.util import hours_since_epoch, hour_to_datetime
+
+import sqlite3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hours (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE,
+    hour INTEGER,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hours_hour ON hours (hour);
+CREATE INDEX IF NOT EXISTS hours_seq ON hours (seq);
+CREATE TABLE IF NOT EXISTS counts (
+    hour_id INTEGER NOT NULL REFERENCES hours (id),
+    food TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (hour_id, food)
+);
+CREATE INDEX IF NOT EXISTS counts_food ON counts (food, hour_id);
+CREATE TABLE IF NOT EXISTS interesting (
+    hour_id INTEGER NOT NULL REFERENCES hours (id),
+    rank INTEGER NOT NULL,
+    food TEXT NOT NULL,
+    PRIMARY KEY (hour_id, rank)
+);
+"""
+
+
+def _hour_range(start, end):
+    """ Convert datetime range to hours, open ends spanning all hours. """
+    start_hour = -(1 << 62) if start is None else hours_since_epoch(start)
+    end_hour = 1 << 62 if end is None else hours_since_epoch(end)
+    return start_hour, end_hour
+
+
+class ResultsStore(object):
+    """
+    SQLite store of the counts and interesting foods output for each file.
+
+    Outputs are indexed by the hour of their source file. Every write is
+    stamped with an increasing sequence number so that changes since some
+    earlier write can be exported without walking all outputs.
+    """
+
+    def __init__(self, path):
+        """
+        Open the store, creating it when missing.
+
+        :param str path: Path to the SQLite database.
+        """
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, valtype, value, traceback):
+        self.close()
+        return False  # do not suppress exceptions
+
+    def close(self):
+        """ Close the store. """
+        self._conn.close()
+
+    @property
+    def last_seq(self):
+        """ Get sequence number of the latest write. """
+        seq, = self._conn.execute('SELECT MAX(seq) FROM hours').fetchone()
+        return 0 if seq is None else seq
+
+    def write(self, source, when, counts, interesting):
+        """
+        Replace the outputs for a source file.
+
+        :param str source: Source file name.
+        :param datetime when: Hour of the source file or None when unknown.
+        :param dict counts: Food counts.
+        :param list interesting: Interesting foods in rank order.
+        """
+        hour = None if when is None else hours_since_epoch(when)
+        with self._conn:
+            seq = self.last_seq + 1
+            row = self._conn.execute('SELECT id FROM hours WHERE source = ?',
+                                     (source,)).fetchone()
+            if row is None:
+                hour_id = self._conn.execute(
+                    'INSERT INTO hours (source, hour, seq) VALUES (?, ?, ?)',
+                    (source, hour, seq)).lastrowid
+            else:
+                hour_id, = row
+                self._conn.execute(
+                    'UPDATE hours SET hour = ?, seq = ? WHERE id = ?',
+                    (hour, seq, hour_id))
+                self._conn.execute('DELETE FROM counts WHERE hour_id = ?',
+                                   (hour_id,))
+                self._conn.execute('DELETE FROM interesting WHERE hour_id = ?',
+                                   (hour_id,))
+            self._conn.executemany(
+                'INSERT INTO counts (hour_id, food, count) VALUES (?, ?, ?)',
+                ((hour_id, food, count) for food, count in counts.iteritems()))
+            self._conn.executemany(
+                'INSERT INTO interesting (hour_id, rank, food) '
+                'VALUES (?, ?, ?)',
+                ((hour_id, rank, food)
+                 for rank, food in enumerate(interesting)))
+
+    def top_foods(self, start=None, end=None, num=10):
+        """
+        Get foods with the largest total counts over hours in [start, end).
+
+        :return list: (food, count) pairs by decreasing count
+        """
+        return self._conn.execute(
+            'SELECT food, SUM(count) AS total FROM counts '
+            'JOIN hours ON hours.id = counts.hour_id '
+            'WHERE hours.hour >= ? AND hours.hour < ? '
+            'GROUP BY food ORDER BY total DESC, food LIMIT ?',
+            _hour_range(start, end) + (num,)).fetchall()
+
+    def food_series(self, food, start=None, end=None):
+        """
+        Get counts of a food for each hour in [start, end) where it appears.
+
+        :return list: (datetime, count) pairs in time order
+        """
+        rows = self._conn.execute(
+            'SELECT hours.hour, SUM(count) FROM counts '
+            'JOIN hours ON hours.id = counts.hour_id '
+            'WHERE counts.food = ? AND hours.hour >= ? AND hours.hour < ? '
+            'GROUP BY hours.hour ORDER BY hours.hour',
+            (food,) + _hour_range(start, end))
+        return [(hour_to_datetime(hour), count) for hour, count in rows]
+
+    def changes(self, since_seq=0):
+        """
+        Get outputs written after a sequence number.
+
+        :return list: dicts with source, hour, seq, counts, and interesting
+        keys in sequence order
+        """
+        hours = self._conn.execute(
+            'SELECT id, source, hour, seq FROM hours WHERE seq > ? '
+            'ORDER BY seq', (since_seq,)).fetchall()
+        changed = []
+        for hour_id, source, hour, seq in hours:
+            counts = dict(self._conn.execute(
+                'SELECT food, count FROM counts WHERE hour_id = ?',
+                (hour_id,)))
+            interesting = [food for food, in self._conn.execute(
+                'SELECT food FROM interesting WHERE hour_id = ? '
+                'ORDER BY rank', (hour_id,))]
+            changed.append({
+                'source': source,
+                'hour': None if hour is None
+                        else hour_to_datetime(hour).isoformat(),
+                'seq': seq,
+                'counts': counts,
+                'interesting': interesting,
+            })
+        return changed
+
+    def changed_sources(self, since_seq=0):
+        """ Get names of source files written after a sequence number. """
+        return [source for source, in self._conn.execute(
+            'SELECT source FROM hours WHERE seq > ? ORDER BY seq',
+            (since_seq,))]
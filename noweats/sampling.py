@@ -0,0 +1,123 @@
+"""
+Shed load by sampling tweets when processing would miss a deadline.
+"""
+import json
+import math
+import zlib
+
+_HASH_RANGE = float(1 << 32)
+
+
+def sample_key(key):
+    """ Hash key to a number in [0, 1) the same way in every process. """
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return (zlib.crc32(str(key)) & 0xffffffff) / _HASH_RANGE
+
+
+def keep_sampled(key, rate):
+    """
+    Decide whether to keep an item sampled at rate.
+
+    The decision depends only on the key, so reprocessing a file at the same
+    rate keeps the same tweets and a lower rate keeps a subset of them.
+    """
+    return rate >= 1. or sample_key(key) < rate
+
+
+def scale_counts(counts, rate):
+    """ Scale counts of sampled items up to estimates for all items. """
+    if rate >= 1.:
+        return dict(counts.iteritems())
+    return {key: int(round(count / rate))
+            for key, count in counts.iteritems()}
+
+
+def count_intervals(counts, rate, z=1.96):
+    """
+    Get confidence intervals of the counts for all items given counts of
+    items sampled at rate.
+
+    Each count is binomial over the true count, so its estimate count / rate
+    has standard error sqrt(count * (1 - rate)) / rate. Intervals never go
+    below the sampled count.
+
+    :return dict: (low, high) of each key
+    """
+    intervals = dict()
+    for key, count in counts.iteritems():
+        estimate = count / rate
+        error = z * math.sqrt(count * (1. - rate)) / rate
+        intervals[key] = (int(math.floor(max(count, estimate - error))),
+                          int(math.ceil(estimate + error)))
+    return intervals
+
+
+class LoadShedder(object):
+    """
+    Choose sampling rates that fit the tweets of a file into a time budget.
+
+    Throughput is measured from files already processed and smoothed, so the
+    rate tracks the machine as load changes. Until a measurement exists all
+    tweets are kept.
+    """
+
+    def __init__(self, smoothing=0.5, min_rate=0.05, headroom=0.9):
+        """
+        Create a shedder with no measurements.
+
+        :param float smoothing: Weight of the newest throughput measurement.
+        :param float min_rate: Lowest sampling rate to use.
+        :param float headroom: Fraction of the time budget to plan to use.
+        """
+        if not 0 < smoothing <= 1:
+            raise ValueError("Parameter smoothing must be in (0, 1]")
+        if not 0 < min_rate <= 1:
+            raise ValueError("Parameter min_rate must be in (0, 1]")
+        self._smoothing = smoothing
+        self._min_rate = min_rate
+        self._headroom = headroom
+        self._throughput = None
+
+    @property
+    def throughput(self):
+        """ Get smoothed tweets processed per second or None. """
+        return self._throughput
+
+    def observe(self, num_tweets, seconds):
+        """ Record that num_tweets were processed in seconds. """
+        if num_tweets <= 0 or seconds <= 0:
+            return
+        measured = num_tweets / float(seconds)
+        if self._throughput is None:
+            self._throughput = measured
+        else:
+            self._throughput += self._smoothing * (measured -
+                                                   self._throughput)
+
+    def rate(self, num_tweets, budget):
+        """
+        Get the sampling rate to process num_tweets within budget seconds.
+        """
+        if self._throughput is None or num_tweets <= 0:
+            return 1.
+        affordable = self._headroom * self._throughput * max(budget, 0.)
+        return max(self._min_rate, min(1., affordable / num_tweets))
+
+    def save(self, fileobj):
+        """ Write shedder state as JSON. """
+        json.dump({
+            'smoothing': self._smoothing,
+            'min_rate': self._min_rate,
+            'headroom': self._headroom,
+            'throughput': self._throughput,
+        }, fileobj)
+
+    @classmethod
+    def load(cls, fileobj):
+        """ Read shedder state written by save(). """
+        state = json.load(fileobj)
+        shedder = cls(state['smoothing'], state['min_rate'],
+                      state['headroom'])
+        shedder._throughput = state['throughput']
+        return shedder
@@ -0,0 +1,182 @@
+"""
+Food count table in shared memory for use across worker processes.
+"""
+from collections import Mapping
+from ctypes import c_char, c_long, memset, sizeof
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawArray
+
+import zlib
+
+_EMPTY = -1
+
+
+class SharedCounter(object):
+    """
+    Hash table of string counts in shared memory.
+
+    The table is split into segments, each an open addressing table with its
+    own key arena and lock, so workers incrementing keys in different segments
+    do not contend. The table must be created before worker processes start
+    and its capacity is fixed, so update() hands back the counts that do not
+    fit for the caller to keep elsewhere.
+    """
+
+    def __init__(self, capacity=1 << 16, arena_bytes=1 << 22,
+                 num_segments=16):
+        """
+        Allocate an empty table.
+
+        :param int capacity: Maximum number of distinct keys.
+        :param int arena_bytes: Maximum total length of distinct keys.
+        :param int num_segments: Number of independently locked segments.
+        """
+        self._num_segments = num_segments
+        self._slots = max(1, 2 * capacity // num_segments)
+        self._arena_size = max(1, arena_bytes // num_segments)
+
+        num_slots = self._slots * num_segments
+        self._hashes = RawArray(c_long, num_slots)
+        self._offsets = RawArray(c_long, num_slots)
+        self._lengths = RawArray(c_long, num_slots)
+        self._counts = RawArray(c_long, num_slots)
+        self._arena = RawArray(c_char, self._arena_size * num_segments)
+        self._arena_used = RawArray(c_long, num_segments)
+        self._sizes = RawArray(c_long, num_segments)
+        self._locks = [Lock() for _ in xrange(num_segments)]
+
+        # All bytes set gives _EMPTY.
+        memset(self._offsets, 0xff, sizeof(self._offsets))
+
+    def _find(self, segment, key, key_hash):
+        """ Find slot of key or the empty slot for it. Hold segment lock. """
+        base = segment * self._slots
+        # Low bits of the hash chose the segment, so use the rest for the slot.
+        slot = (key_hash // self._num_segments) % self._slots
+        for _ in xrange(self._slots):
+            idx = base + slot
+            offset = self._offsets[idx]
+            if offset == _EMPTY:
+                return idx
+            if self._hashes[idx] == key_hash \
+                    and self._lengths[idx] == len(key) \
+                    and self._arena[offset:offset + len(key)] == key:
+                return idx
+            slot = (slot + 1) % self._slots
+        return None
+
+    @staticmethod
+    def _hash(key):
+        """ Hash key the same way in every process. """
+        return zlib.crc32(key) & 0x7fffffff
+
+    def increment(self, key, count=1):
+        """ Add count to key. """
+
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+
+        key_hash = self._hash(key)
+        segment = key_hash % self._num_segments
+        with self._locks[segment]:
+
+            idx = self._find(segment, key, key_hash)
+            if idx is None:
+                raise ValueError("Shared counter segment is full")
+
+            if self._offsets[idx] == _EMPTY:
+                used = self._arena_used[segment]
+                if used + len(key) > self._arena_size:
+                    raise ValueError("Shared counter arena is full")
+                offset = segment * self._arena_size + used
+                self._arena[offset:offset + len(key)] = key
+                self._arena_used[segment] = used + len(key)
+                self._hashes[idx] = key_hash
+                self._lengths[idx] = len(key)
+                self._offsets[idx] = offset
+                self._sizes[segment] += 1
+
+            self._counts[idx] += count
+
+    def update(self, counts):
+        """
+        Add a dict of counts.
+
+        :return dict: counts of keys that did not fit, empty unless the table
+        is full
+        """
+        overflow = dict()
+        for key, count in counts.iteritems():
+            try:
+                self.increment(key, count)
+            except ValueError:
+                overflow[key] = count
+        return overflow
+
+    def get(self, key, default=0):
+        """ Get count of key. Reads do not lock, so read after updates. """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        key_hash = self._hash(key)
+        segment = key_hash % self._num_segments
+        idx = self._find(segment, key, key_hash)
+        if idx is None or self._offsets[idx] == _EMPTY:
+            return default
+        return self._counts[idx]
+
+    def clear(self):
+        """ Remove all keys. Workers must not be incrementing. """
+        memset(self._offsets, 0xff, sizeof(self._offsets))
+        memset(self._counts, 0, sizeof(self._counts))
+        memset(self._arena_used, 0, sizeof(self._arena_used))
+        memset(self._sizes, 0, sizeof(self._sizes))
+
+    def __len__(self):
+        return sum(self._sizes)
+
+    def iteritems(self):
+        """ Iterate over (key, count) pairs. """
+        for idx in xrange(len(self._offsets)):
+            offset = self._offsets[idx]
+            if offset != _EMPTY:
+                yield (self._arena[offset:offset + self._lengths[idx]],
+                       self._counts[idx])
+
+    def view(self):
+        """ Get a read-only dict-like view of the counts. """
+        return SharedCounterView(self)
+
+
+class SharedCounterView(Mapping):
+    """
+    Read-only mapping over a SharedCounter.
+
+    The view may stand in for the dict returned by noweats.util.counter().
+    """
+
+    def __init__(self, shared_counter):
+        self._counter = shared_counter
+
+    def __getitem__(self, key):
+        count = self._counter.get(key, None)
+        if count is None:
+            raise KeyError(key)
+        return count
+
+    def __contains__(self, key):
+        return self._counter.get(key, None) is not None
+
+    def __iter__(self):
+        return (key for key, _ in self._counter.iteritems())
+
+    def __len__(self):
+        return len(self._counter)
+
+    def iteritems(self):
+        return self._counter.iteritems()
+
+    def itervalues(self):
+        return (count for _, count in self._counter.iteritems())
+
+    def items(self):
+        return list(self._counter.iteritems())
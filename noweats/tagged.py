@@ -0,0 +1,295 @@
+"""
+Compact storage for batches of POS tagged tweets.
+"""
+from array import array
+
+import json
+import itertools as its
+
+_ID_TYPECODE = 'i'
+_TAG_TYPECODE = 'B'
+_MAX_TAGS = 256
+
+
+def _intern_all(items, target, target_ids):
+    """
+    Get the id in target of each item, appending missing items to target.
+
+    :param list target: Items indexed by id.
+    :param dict target_ids: Id of each item in target.
+    :return list: id of each item
+    """
+    ids = []
+    for item in items:
+        item_id = target_ids.get(item)
+        if item_id is None:
+            item_id = target_ids[item] = len(target)
+            target.append(item)
+        ids.append(item_id)
+    return ids
+
+
+def _remap_ids(ids, source, target, target_ids):
+    """
+    Rewrite ids into source as ids into target, appending missing items to
+    target.
+
+    :param array ids: Ids into source.
+    :param list source: Items indexed by id.
+    :param list target: Items indexed by id.
+    :param dict target_ids: Id of each item in target.
+    :return array: ids into target
+    """
+    id_map = dict()
+    remapped = array(ids.typecode)
+    for old_id in ids:
+        new_id = id_map.get(old_id)
+        if new_id is None:
+            item = source[old_id]
+            new_id = target_ids.get(item)
+            if new_id is None:
+                new_id = target_ids[item] = len(target)
+                target.append(item)
+            id_map[old_id] = new_id
+        remapped.append(new_id)
+    return remapped
+
+
+class TaggedBatch(object):
+    """
+    A batch of POS tagged tweets stored as flat arrays.
+
+    Words are interned as integer ids into a vocabulary and tags are stored as
+    one byte codes. Sentence boundaries are offsets into the token arrays and
+    tweet boundaries are offsets into the sentence offsets. Iterating yields
+    the same tuples of [(word, tag), ...] sentences that pos_tag_tweet()
+    returns.
+
+    Slicing returns a view sharing the arrays of the batch it came from.
+    """
+
+    def __init__(self, vocab, tags, word_ids, tag_codes,
+                 sentence_offsets, tweet_offsets, start=0, stop=None):
+        """
+        Create a batch from its arrays. See from_tweets() to encode tweets.
+
+        :param list vocab: Words indexed by id.
+        :param list tags: Tags indexed by code.
+        :param array word_ids: Word id of each token.
+        :param array tag_codes: Tag code of each token.
+        :param array sentence_offsets: Token offset of each sentence start
+        followed by the total number of tokens.
+        :param array tweet_offsets: Sentence offset of each tweet start followed
+        by the total number of sentences.
+        :param int start: First tweet of the view.
+        :param int stop: End tweet of the view.
+        """
+        self._vocab = vocab
+        self._tags = tags
+        self._word_ids = word_ids
+        self._tag_codes = tag_codes
+        self._sentence_offsets = sentence_offsets
+        self._tweet_offsets = tweet_offsets
+        self._start = start
+        self._stop = len(tweet_offsets) - 1 if stop is None else stop
+
+    @classmethod
+    def from_tweets(cls, tagged_tweets):
+        """ Encode an iterable of POS tagged tweets. """
+
+        vocab, word_to_id = [], dict()
+        tags, tag_to_code = [], dict()
+        word_ids = array(_ID_TYPECODE)
+        tag_codes = array(_TAG_TYPECODE)
+        sentence_offsets = array(_ID_TYPECODE, [0])
+        tweet_offsets = array(_ID_TYPECODE, [0])
+
+        for tweet in tagged_tweets:
+            for sentence in tweet:
+                for word, tag in sentence:
+
+                    word_id = word_to_id.get(word)
+                    if word_id is None:
+                        word_id = word_to_id[word] = len(vocab)
+                        vocab.append(word)
+                    word_ids.append(word_id)
+
+                    tag_code = tag_to_code.get(tag)
+                    if tag_code is None:
+                        if len(tags) == _MAX_TAGS:
+                            raise ValueError("More than {} distinct tags"
+                                             .format(_MAX_TAGS))
+                        tag_code = tag_to_code[tag] = len(tags)
+                        tags.append(tag)
+                    tag_codes.append(tag_code)
+
+                sentence_offsets.append(len(word_ids))
+            tweet_offsets.append(len(sentence_offsets) - 1)
+
+        return cls(vocab, tags, word_ids, tag_codes,
+                   sentence_offsets, tweet_offsets)
+
+    @classmethod
+    def concat(cls, batches):
+        """
+        Join batches into one batch with a single vocabulary.
+
+        Word ids and tag codes of each batch are mapped into the joined
+        vocabulary and tags and offsets are rebased, so tweets are never
+        decoded.
+        """
+
+        vocab, word_to_id = [], dict()
+        tags, tag_to_code = [], dict()
+        word_ids = array(_ID_TYPECODE)
+        tag_codes = array(_TAG_TYPECODE)
+        sentence_offsets = array(_ID_TYPECODE, [0])
+        tweet_offsets = array(_ID_TYPECODE, [0])
+
+        for batch in batches:
+
+            # Compacted batches use every word of their vocabulary.
+            batch_vocab, (batch_word_ids, batch_tag_codes,
+                          batch_sentence_offsets, batch_tweet_offsets) = \
+                batch._compacted()
+            word_map = _intern_all(batch_vocab, vocab, word_to_id)
+            tag_map = _intern_all(batch.tags, tags, tag_to_code)
+            if len(tags) > _MAX_TAGS:
+                raise ValueError("More than {} distinct tags"
+                                 .format(_MAX_TAGS))
+
+            token_base = len(word_ids)
+            sentence_base = len(sentence_offsets) - 1
+            word_ids.extend(its.imap(word_map.__getitem__, batch_word_ids))
+            tag_codes.extend(its.imap(tag_map.__getitem__, batch_tag_codes))
+            sentence_offsets.extend(offset + token_base
+                                    for offset in batch_sentence_offsets[1:])
+            tweet_offsets.extend(offset + sentence_base
+                                 for offset in batch_tweet_offsets[1:])
+
+        return cls(vocab, tags, word_ids, tag_codes,
+                   sentence_offsets, tweet_offsets)
+
+    @property
+    def vocab(self):
+        """ Get words indexed by id. """
+        return self._vocab
+
+    @property
+    def tags(self):
+        """ Get tags indexed by code. """
+        return self._tags
+
+    @property
+    def nbytes(self):
+        """ Get bytes used by the arrays of this batch. """
+        return sum(arr.itemsize * len(arr)
+                   for arr in (self._word_ids, self._tag_codes,
+                               self._sentence_offsets, self._tweet_offsets))
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def _tweet(self, idx):
+        """ Decode tweet at absolute index idx. """
+        vocab, tags = self._vocab, self._tags
+        word_ids, tag_codes = self._word_ids, self._tag_codes
+        offsets = self._sentence_offsets
+        return tuple(
+            [(vocab[word_ids[tok]], tags[tag_codes[tok]])
+             for tok in xrange(offsets[sent], offsets[sent + 1])]
+            for sent in xrange(self._tweet_offsets[idx],
+                               self._tweet_offsets[idx + 1]))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("Slices of a batch must be contiguous")
+            stop = max(start, stop)
+            return TaggedBatch(self._vocab, self._tags, self._word_ids,
+                               self._tag_codes, self._sentence_offsets,
+                               self._tweet_offsets, self._start + start,
+                               self._start + stop)
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError("Tweet index out of range")
+        return self._tweet(self._start + key)
+
+    def __iter__(self):
+        return (self._tweet(idx) for idx in xrange(self._start, self._stop))
+
+    def _compacted(self):
+        """
+        Copy the view rebased to start at zero with only the words it uses.
+
+        :return tuple: vocabulary and arrays of the view
+        """
+        first_sent = self._tweet_offsets[self._start]
+        last_sent = self._tweet_offsets[self._stop]
+        first_tok = self._sentence_offsets[first_sent]
+        last_tok = self._sentence_offsets[last_sent]
+        rebase = lambda arr, first, last, base: array(
+            _ID_TYPECODE, (offset - base for offset in arr[first:last]))
+        if first_tok == 0 and last_tok == len(self._word_ids):
+            vocab, word_ids = self._vocab, self._word_ids
+        else:
+            vocab = []
+            word_ids = _remap_ids(self._word_ids[first_tok:last_tok],
+                                  self._vocab, vocab, dict())
+        return vocab, (word_ids,
+                       self._tag_codes[first_tok:last_tok],
+                       rebase(self._sentence_offsets, first_sent,
+                              last_sent + 1, first_tok),
+                       rebase(self._tweet_offsets, self._start,
+                              self._stop + 1, first_sent))
+
+    def __getstate__(self):
+        vocab, arrays = self._compacted()
+        return (vocab, self._tags,
+                tuple(arr.tostring() for arr in arrays))
+
+    def __setstate__(self, state):
+        vocab, tags, strings = state
+        typecodes = (_ID_TYPECODE, _TAG_TYPECODE, _ID_TYPECODE, _ID_TYPECODE)
+        arrays = [array(typecode) for typecode in typecodes]
+        for arr, string in its.izip(arrays, strings):
+            arr.fromstring(string)
+        self.__init__(vocab, tags, *arrays)
+
+    def save(self, fileobj):
+        """
+        Write the batch to a binary file.
+
+        The file has a JSON header line followed by the raw arrays.
+        """
+        vocab, arrays = self._compacted()
+        header = {
+            'vocab': vocab,
+            'tags': self._tags,
+            'itemsize': [arr.itemsize for arr in arrays],
+            'lengths': [len(arr) for arr in arrays],
+        }
+        fileobj.write(json.dumps(header))
+        fileobj.write('\n')
+        for arr in arrays:
+            fileobj.write(arr.tostring())
+
+    @classmethod
+    def load(cls, fileobj):
+        """ Read a batch written by save(). """
+        header = json.loads(fileobj.readline())
+        typecodes = (_ID_TYPECODE, _TAG_TYPECODE, _ID_TYPECODE, _ID_TYPECODE)
+        arrays = []
+        for typecode, itemsize, length in its.izip(
+                typecodes, header['itemsize'], header['lengths']):
+            arr = array(typecode)
+            if arr.itemsize != itemsize:
+                raise ValueError("Batch saved with {} byte items but "
+                                 "expected {}".format(itemsize, arr.itemsize))
+            arr.fromstring(fileobj.read(itemsize * length))
+            arrays.append(arr)
+        vocab = [word.encode('utf-8') for word in header['vocab']]
+        tags = [tag.encode('utf-8') for tag in header['tags']]
+        return cls(vocab, tags, *arrays)
@@ -0,0 +1,185 @@
+"""
+Detect trending foods against decayed baselines built from past counts.
+"""
+import json
+import math
+
+
+class TrendDetector(object):
+    """
+    Streaming trend detector over hourly food count snapshots.
+
+    Each food keeps an exponentially decayed count and the detector keeps a
+    decayed total over all foods, so the baseline rate of a food is the ratio
+    of the two. Decay is applied lazily when a food is touched, which makes
+    each update cost O(foods in the snapshot) regardless of history length.
+    A food trends only once its baseline spans min_age snapshots, so foods
+    never seen before do not trend on their first counts.
+    """
+
+    def __init__(self, half_life=24., z_thresh=3., min_count=3,
+                 prior_count=1., min_weight=1e-3, prune_interval=168,
+                 min_age=24):
+        """
+        Create an empty detector.
+
+        :param float half_life: Snapshots until a past count weighs half.
+        :param float z_thresh: Minimum significance score to trend.
+        :param int min_count: Minimum count in the snapshot to trend.
+        :param float prior_count: Pseudo-count added to every expectation.
+        :param float min_weight: Decayed count below which a food is pruned.
+        :param int prune_interval: Snapshots between pruning passes.
+        :param int min_age: Snapshots a food needs a baseline for to trend.
+        """
+
+        if half_life <= 0:
+            raise ValueError("Parameter half_life must be positive")
+
+        self._half_life = float(half_life)
+        self._decay = 0.5 ** (1. / half_life)
+        self._z_thresh = z_thresh
+        self._min_count = min_count
+        self._prior_count = prior_count
+        self._min_weight = min_weight
+        self._prune_interval = prune_interval
+        self._min_age = min_age
+        self._step = None
+        self._last_prune = None
+        self._total = 0.
+        self._baselines = {}
+
+    def _decayed(self, weight, since, step):
+        """ Decay weight from step since to step. """
+        return weight * self._decay ** (step - since)
+
+    @property
+    def step(self):
+        """ Get step of the last snapshot or None. """
+        return self._step
+
+    def age(self, food, step=None):
+        """ Get snapshots since the baseline of food began or None. """
+        step = self._step if step is None else step
+        if step is None or food not in self._baselines:
+            return None
+        return step - self._baselines[food][2]
+
+    def baseline(self, food, step=None):
+        """ Get decayed count and rate of food at step. """
+
+        step = self._step if step is None else step
+        if step is None or food not in self._baselines:
+            return 0., 0.
+
+        weight, since, _ = self._baselines[food]
+        weight = self._decayed(weight, since, step)
+        total = self._decayed(self._total, self._step, step)
+        rate = weight / total if total > 0 else 0.
+        return weight, rate
+
+    def score(self, food, count, total, step=None):
+        """
+        Score how much count exceeds the baseline for a snapshot total.
+
+        The score is a Poisson z-score of count against its expectation.
+        """
+
+        _, rate = self.baseline(food, step)
+        expected = rate * total
+        return (count - expected) / math.sqrt(expected + self._prior_count)
+
+    def update(self, counts, step=None, num_to_find=None):
+        """
+        Add a snapshot of counts and return foods trending in it.
+
+        :param dict counts: Food counts for the snapshot.
+        :param int step: Snapshot index (e.g. hours since epoch). Gaps decay
+        baselines accordingly. Defaults to the step after the last update.
+        Each step may be added only once.
+        :param int num_to_find: Maximum number of foods to return.
+        :return list: trending foods ordered by decreasing score
+        """
+
+        if step is None:
+            step = 0 if self._step is None else self._step + 1
+        elif self._step is not None and step <= self._step:
+            raise ValueError("Snapshot step {} does not follow last step {}"
+                             .format(step, self._step))
+
+        total = sum(counts.itervalues())
+
+        # Score against the baseline before this snapshot joins it. Foods
+        # without a baseline old enough have nothing to beat.
+        if self._step is not None:
+            scores = ((self.score(food, count, total, step), food)
+                      for food, count in counts.iteritems()
+                      if count >= self._min_count
+                      and self.age(food, step) is not None
+                      and self.age(food, step) >= self._min_age)
+            trending = sorted((item for item in scores
+                               if item[0] > self._z_thresh), reverse=True)
+        else:
+            trending = []
+
+        # Fold snapshot into the baselines.
+        prev_total = 0. if self._step is None \
+            else self._decayed(self._total, self._step, step)
+        self._total = prev_total + total
+        for food, count in counts.iteritems():
+            weight, _ = self.baseline(food, step) \
+                if self._step is not None else (0., 0.)
+            first = self._baselines[food][2] if food in self._baselines \
+                else step
+            self._baselines[food] = [weight + count, step, first]
+        self._step = step
+
+        if self._last_prune is None:
+            self._last_prune = step
+        elif step - self._last_prune >= self._prune_interval:
+            self.prune()
+
+        foods = [food for _, food in trending]
+        if num_to_find is None:
+            return foods
+        else:
+            return foods[:num_to_find]
+
+    def prune(self):
+        """ Drop foods whose decayed counts fell below the minimum weight. """
+        for food, (weight, since, _) in self._baselines.items():
+            if self._decayed(weight, since, self._step) < self._min_weight:
+                del self._baselines[food]
+        self._last_prune = self._step
+
+    def __len__(self):
+        return len(self._baselines)
+
+    def save(self, fileobj):
+        """ Write detector state as JSON. """
+        json.dump({
+            'half_life': self._half_life,
+            'z_thresh': self._z_thresh,
+            'min_count': self._min_count,
+            'prior_count': self._prior_count,
+            'min_weight': self._min_weight,
+            'prune_interval': self._prune_interval,
+            'min_age': self._min_age,
+            'step': self._step,
+            'last_prune': self._last_prune,
+            'total': self._total,
+            'baselines': self._baselines,
+        }, fileobj)
+
+    @classmethod
+    def load(cls, fileobj):
+        """ Read detector state written by save(). """
+        state = json.load(fileobj)
+        detector = cls(state['half_life'], state['z_thresh'],
+                       state['min_count'], state['prior_count'],
+                       state['min_weight'], state['prune_interval'],
+                       state['min_age'])
+        detector._step = state['step']
+        detector._last_prune = state['last_prune']
+        detector._total = state['total']
+        detector._baselines = state['baselines']
+        return detector
@@ -2,6 +2,19 @@
 Some utility methods.
 """
 from collections import defaultdict
+from datetime import datetime, timedelta
+
+import bz2
+import os
+import re
+
+_RE_ROLLOVER_SUFFIX = re.compile('\\.(\\d{4}-\\d{2}-\\d{2}_\\d{2})')
+
+_ROLLOVER_FORMAT = '%Y-%m-%d_%H'
+
+_EPOCH = datetime(1970, 1, 1)
+
+_BZ2_MAGIC = 'BZh'
 
 
 def counter(iterable):
@@ -10,3 +23,133 @@ def counter(iterable):
     for item in iterable:
         counts[item] += 1
     return counts
+
+
+def open_archive(path):
+    """ Open a collected data file, compressed or not. """
+    with open(path, 'rb') as data_file:
+        is_bz2 = data_file.read(len(_BZ2_MAGIC)) == _BZ2_MAGIC
+    return bz2.BZ2File(path, 'rb') if is_bz2 else open(path, 'rb')
+
+
+def rollover_time(path):
+    """
+    Get the hour of a file rolled over by the stream listener.
+
+    :return datetime: time in the filename suffix or None when missing
+    """
+    match = _RE_ROLLOVER_SUFFIX.search(os.path.basename(path))
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1), _ROLLOVER_FORMAT)
+
+
+def hours_since_epoch(when):
+    """ Count whole hours from the epoch to a datetime. """
+    delta = when - _EPOCH
+    return delta.days * 24 + delta.seconds // 3600
+
+
+def hour_to_datetime(hours):
+    """ Convert hours since the epoch to a datetime. """
+    return _EPOCH + timedelta(hours=hours)
+
+
+class StreamingQuantile(object):
+    """
+    Estimate a quantile of a stream in constant memory.
+
+    Uses the P-square algorithm of Jain and Chlamtac (1985), which tracks five
+    markers whose heights approximate the minimum, the quantile, the maximum,
+    and the quantiles halfway to either extreme.
+    """
+
+    def __init__(self, quantile):
+        """
+        Create an estimator.
+
+        :param float quantile: Quantile to estimate in [0, 1].
+        """
+        if quantile < 0 or quantile > 1:
+            raise ValueError("Parameter quantile must be in [0, 1]")
+        self._quantile = quantile
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * quantile, 1 + 4 * quantile,
+                         3 + 2 * quantile, 5]
+        self._increments = [0, quantile / 2., quantile,
+                            (1 + quantile) / 2., 1]
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, value):
+        """ Add a value from the stream. """
+
+        self._count += 1
+        heights = self._heights
+
+        # Collect the first five values exactly.
+        if self._count <= 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        # Find the cell of the value, extending the extremes.
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+
+        positions = self._positions
+        for i in xrange(cell + 1, 5):
+            positions[i] += 1
+        for i in xrange(5):
+            self._desired[i] += self._increments[i]
+
+        # Adjust the middle markers toward their desired positions.
+        for i in xrange(1, 4):
+            offset = self._desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or \
+                    (offset <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, step)
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i, step):
+        """ Piecewise-parabolic height prediction for marker i. """
+        heights, positions = self._heights, self._positions
+        span = float(positions[i + 1] - positions[i - 1])
+        return heights[i] + step / span * (
+            (positions[i] - positions[i - 1] + step)
+            * (heights[i + 1] - heights[i])
+            / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - step)
+            * (heights[i] - heights[i - 1])
+            / (positions[i] - positions[i - 1]))
+
+    def _linear(self, i, step):
+        """ Linear height prediction for marker i. """
+        heights, positions = self._heights, self._positions
+        return heights[i] + step * (heights[i + step] - heights[i]) \
+            / float(positions[i + step] - positions[i])
+
+    @property
+    def value(self):
+        """ Get the current estimate or None when no values were added. """
+        if self._count == 0:
+            return None
+        if self._count <= 5:
+            rank = int(round(self._quantile * (self._count - 1)))
+            return self._heights[rank]
+        return self._heights[2]
@@ -17,5 +17,11 @@ setup(name='NowEats',
           'bin/process_new',
           'bin/compress_data',
           'bin/link_numpy',
+          'bin/alias_table',
+          'bin/query_results',
+          'bin/replay_load_test',
+          'bin/query_geo',
+          'bin/find_sources',
+          'bin/bench_tagged',
       ],
       )
@@ -36,6 +36,17 @@ try_start_collect() {
   fi
 }
 
+sync_output() {
+    # Only send outputs written since the last successful sync.
+    sync_state="${COLLECT_HOME}/sync.state"
+    sync_files="${COLLECT_HOME}/sync.files"
+    query_results "${COLLECT_HOME}/output/results.db" export --files \
+        --state "${sync_state}" > "${sync_files}" || return
+    /usr/bin/nice -n 19 /usr/bin/rsync --files-from="${sync_files}" \
+        "${COLLECT_HOME}/output/" "${REMOTE_PATH}" \
+        && /bin/mv "${sync_state}.pending" "${sync_state}"
+}
+
 run() {
     trap "cleanup" SIGINT SIGTERM EXIT
 
@@ -47,7 +58,7 @@ run() {
     do
         try_start_collect
         /usr/bin/nice -n 19 process_new "${COLLECT_HOME}/collect" "${COLLECT_HOME}/output"
-        /usr/bin/nice -n 19 /usr/bin/rsync -r "${COLLECT_HOME}/output/" "${REMOTE_PATH}"
+        sync_output
         sleep 300.0
     done
 }